@@ -1,8 +1,25 @@
 from pathlib import Path
 import os
+import warnings
 
+import numpy as np
+import pandas as pd
+import skimage.io
+import dask
+import dask.array as da
 from oirpy.oirreader import Oirreader
 
+# Keys of oirpy's Oirreader.get_meta() holding image shape and pixel type.
+# Only "channel_names" is used elsewhere (oirloader); these names could not
+# be checked against oirpy and must be adjusted here if oirpy names them
+# differently. preflight_check warns if no file provides them.
+META_HEIGHT = "size_y"
+META_WIDTH = "size_x"
+META_DTYPE = "dtype"
+META_BIT_DEPTH = "bit_depth"
+
+SUPPORTED_DTYPES = ["uint8", "uint16"]
+
 def oirloader(filepath):
 
     if isinstance(filepath, str):
@@ -19,6 +36,50 @@ def oirloader(filepath):
         return None
     return stack, channels
 
+def oirmetadata(filepath):
+    """
+    Read only the metadata of an oir file without decoding the pixel data.
+
+    Parameters
+    ----------
+    filepath: str or Path
+        path to oir file
+
+    Returns
+    -------
+    meta: dict
+        filepath, channels, height, width, dtype and error.
+        Fields that are missing from the metadata are None (callers must
+        check them) and error contains the reason if the metadata could
+        not be read at all.
+
+    """
+
+    filepath = Path(filepath)
+    meta = {
+        "filepath": filepath,
+        "channels": None,
+        "height": None,
+        "width": None,
+        "dtype": None,
+        "error": None,
+    }
+    try:
+        oir_meta = Oirreader(filepath).get_meta()
+        meta["channels"] = list(oir_meta["channel_names"])
+    except Exception as e:
+        meta["error"] = "Loading error: " + str(e)
+        return meta
+
+    meta["height"] = oir_meta.get(META_HEIGHT)
+    meta["width"] = oir_meta.get(META_WIDTH)
+    if oir_meta.get(META_DTYPE) is not None:
+        meta["dtype"] = str(oir_meta[META_DTYPE])
+    elif oir_meta.get(META_BIT_DEPTH) is not None:
+        meta["dtype"] = "uint8" if oir_meta[META_BIT_DEPTH] <= 8 else "uint16"
+
+    return meta
+
 def find_oir_files(directory):
 
     all_dirs = []
@@ -26,4 +87,238 @@ def find_oir_files(directory):
         if len(list(Path(dirName).glob('*.oir'))) > 0:
             all_dirs.append(dirName)
 
-    return all_dirs
\ No newline at end of file
+    return all_dirs
+
+
+MASK_DTYPES = {"nucl": np.uint8, "cell": np.uint8, "bact": np.uint16}
+
+
+def _load_stack(filepath):
+    """Load an oir file as 3d array (height, width, channels)."""
+
+    loaded = oirloader(filepath)
+    if loaded is None:
+        raise IOError("Could not load " + str(filepath))
+    return loaded[0]
+
+
+def _load_mask(filepath, shape, dtype):
+    """Load a mask tif file or return an empty mask if it does not exist."""
+
+    if not Path(filepath).is_file():
+        return np.zeros(shape, dtype=dtype)
+    return skimage.io.imread(filepath).astype(dtype)
+
+
+class Experiment:
+    """
+    Index of all oir files of an experiment folder giving access to raw
+    channels and segmentation masks as lazy dask arrays. Each chunk
+    corresponds to one channel of one image and is only read when
+    needed. Oir files cannot be read per channel, so all chunks of
+    an image share a single decoding task.
+
+    Parameters
+    ----------
+    data_folder: str or Path
+        main folder containing oir files or sub-folders with oir files
+    analysis_folder: str or Path, optional
+        folder containing analysed files, either with the same sub-folder
+        structure as data_folder or flat
+    image_shape: tuple, optional
+        (height, width) of images, only used for files whose metadata
+        does not contain the shape
+    dtype: str, optional
+        pixel type of images, only used for files whose metadata does
+        not contain it
+
+    Attributes
+    ----------
+    files: DataFrame
+        one row per oir file with filepath, channels, height, width
+        and dtype
+    rejected: DataFrame
+        files whose metadata could not be read, with the reason
+    skipped: DataFrame
+        files left out by the last call to select (and thus raw or
+        masks) because they miss requested channels
+
+    """
+
+    def __init__(self, data_folder, analysis_folder=None, image_shape=None, dtype=None):
+
+        self.data_folder = Path(data_folder).resolve()
+        self.analysis_folder = analysis_folder
+        if analysis_folder is not None:
+            self.analysis_folder = Path(analysis_folder).resolve()
+
+        all_files = []
+        # sorted so that image indices do not depend on os.walk order
+        for d in sorted(find_oir_files(self.data_folder)):
+            all_files += sorted(Path(d).glob("*.oir"))
+
+        all_meta = dask.compute(*[dask.delayed(oirmetadata)(f) for f in all_files])
+
+        valid = []
+        rejected = []
+        for meta in all_meta:
+            if meta["error"] is not None:
+                rejected.append({"filepath": meta["filepath"], "reason": meta["error"]})
+                continue
+            if None in [meta["height"], meta["width"]]:
+                if image_shape is None:
+                    raise ValueError(
+                        "Shape of " + str(meta["filepath"]) + " not in metadata, "
+                        "pass it with image_shape=")
+                meta["height"], meta["width"] = image_shape
+            if meta["dtype"] is None:
+                if dtype is None:
+                    raise ValueError(
+                        "dtype of " + str(meta["filepath"]) + " not in metadata, "
+                        "pass it with dtype=")
+                meta["dtype"] = str(dtype)
+            valid.append(meta)
+
+        self.files = pd.DataFrame(
+            valid, columns=["filepath", "channels", "height", "width", "dtype"])
+        self.rejected = pd.DataFrame(rejected, columns=["filepath", "reason"])
+        self.skipped = pd.DataFrame(columns=["filepath", "reason"])
+        if len(rejected) > 0:
+            warnings.warn(
+                str(len(rejected)) + " files could not be read, see Experiment.rejected")
+
+    def __len__(self):
+        return len(self.files)
+
+    def select(self, channels=None, shape=None):
+        """
+        Files used by raw and masks with the same arguments, row k
+        corresponding to image k. Files missing one of the channels are
+        left out and listed in skipped.
+
+        Parameters
+        ----------
+        channels: list of str, optional
+            channel names that files must contain
+        shape: tuple, optional
+            (height, width) of images to include, needed if images
+            in the experiment have different shapes
+
+        Returns
+        -------
+        files: DataFrame
+            selected rows of files
+
+        """
+
+        if isinstance(channels, str):
+            channels = [channels]
+        files = self.files
+        if channels is not None:
+            has_channels = files["channels"].apply(
+                lambda x: all([c in x for c in channels]))
+            self.skipped = pd.DataFrame({
+                "filepath": files["filepath"][~has_channels],
+                "reason": "missing channels " + str(channels)},
+                columns=["filepath", "reason"]).reset_index(drop=True)
+            if len(self.skipped) > 0:
+                warnings.warn(
+                    str(len(self.skipped)) + " files miss channels " + str(channels)
+                    + ", see Experiment.skipped")
+            files = files[has_channels]
+
+        if len(files) == 0:
+            raise ValueError("No readable oir files with the requested channels in "
+                             + str(self.data_folder))
+        shapes = sorted(set(zip(files["height"], files["width"])))
+        if shape is None:
+            if len(shapes) > 1:
+                raise ValueError(
+                    "Images have different shapes " + str(shapes) + ", select one with shape=")
+            return files
+        files = files[
+            (files["height"] == shape[0]) & (files["width"] == shape[1])]
+        if len(files) == 0:
+            raise ValueError(
+                "No images of shape " + str(tuple(shape)) + ", available shapes are " + str(shapes))
+        return files
+
+    def raw(self, channels, shape=None):
+        """
+        Raw images as dask array of shape (images, channels, height, width).
+
+        Parameters
+        ----------
+        channels: list of str
+            channel names to include
+        shape: tuple, optional
+            (height, width) of images to include, needed if images
+            in the experiment have different shapes
+
+        Returns
+        -------
+        images: dask array
+            images in the order of select(channels, shape), files
+            missing a channel are skipped
+
+        """
+
+        if isinstance(channels, str):
+            channels = [channels]
+        files = self.select(channels, shape)
+        images = []
+        for _, row in files.iterrows():
+            # one decoding task per file shared by all its channels
+            stack = dask.delayed(_load_stack)(row["filepath"])
+            images.append(da.stack([
+                da.from_delayed(
+                    stack[:, :, row["channels"].index(c)],
+                    shape=(row["height"], row["width"]), dtype=row["dtype"])
+                for c in channels]))
+        return da.stack(images)
+
+    def mask_path(self, filepath, kind):
+        """Path of a segmentation mask of kind "nucl", "cell" or "bact"."""
+
+        filepath = Path(filepath)
+        name = filepath.stem + "_" + kind + "_seg.tif"
+        nested = self.analysis_folder.joinpath(
+            filepath.parent.relative_to(self.data_folder), name)
+        if nested.is_file():
+            return nested
+        return self.analysis_folder.joinpath(name)
+
+    def masks(self, kind, shape=None, channels=None):
+        """
+        Segmentation masks as dask array of shape (images, height, width).
+        Missing masks are returned as empty masks.
+
+        Parameters
+        ----------
+        kind: str
+            "nucl", "cell" or "bact"
+        shape: tuple, optional
+            (height, width) of images to include, needed if images
+            in the experiment have different shapes
+        channels: list of str, optional
+            only include files with these channels, to match the images
+            returned by raw with the same channels
+
+        Returns
+        -------
+        masks: dask array
+
+        """
+
+        if self.analysis_folder is None:
+            raise ValueError("No analysis_folder set")
+        dtype = MASK_DTYPES[kind]
+        files = self.select(channels, shape)
+        masks = []
+        for _, row in files.iterrows():
+            im_shape = (row["height"], row["width"])
+            masks.append(da.from_delayed(
+                dask.delayed(_load_mask)(
+                    self.mask_path(row["filepath"], kind), im_shape, dtype),
+                shape=im_shape, dtype=dtype))
+        return da.stack(masks)
@@ -8,10 +8,33 @@ Class implementing a simple file browser for Jupyter
 
 import ipywidgets as ipw
 from pathlib import Path
+import os
+import threading
 
 
 class Folders:
-    def __init__(self, rows=10):
+    """
+    File browser widget. Directory listings are cached and only redone
+    when the directory modification time changes. Directories that are
+    not cached yet are listed in a background thread.
+
+    Parameters
+    ----------
+    rows: int
+        number of visible rows
+    file_filter: str or tuple of str, optional
+        only show files with these extensions e.g. ".oir"
+    page_size: int
+        maximal number of files shown at once, more can be added
+        by selecting the last entry
+
+    """
+
+    more_label = "[show more files]"
+    loading_label = "[loading...]"
+    error_label = "[folder not readable]"
+
+    def __init__(self, rows=10, file_filter=None, page_size=500):
 
         style = {"description_width": "initial"}
         layout = {"width": "300px"}
@@ -19,57 +42,139 @@ class Folders:
         self.cur_dir = Path(".").resolve()
         self.out = ipw.Output()
 
+        if isinstance(file_filter, str):
+            file_filter = (file_filter,)
+        if file_filter is not None:
+            file_filter = tuple(f.lower() for f in file_filter)
+        self.file_filter = file_filter
+        self.page_size = page_size
+        self.num_pages = 1
+        self._cache = {}
+        self._lock = threading.Lock()
+
         self.file_list = ipw.SelectMultiple(
             rows=rows, layout={"width": "500px"})
-        self.file_list.options = [".."] + self.get_files()
+        self.file_list.options = [".."]
         self.file_list.value = ()
         self.file_list.observe(self.move_folders, names=["value"])
+        self.refresh()
 
         self.refresh_button = ipw.Button(
             description="Refresh folder content", style=style, layout=layout
         )
-        self.refresh_button.on_click(self.refresh)
+        self.refresh_button.on_click(self.force_refresh)
+
+    def list_directory(self, directory):
+        """Return sorted folders and files of directory, using the cache
+        if the directory did not change."""
+
+        mtime = os.stat(directory).st_mtime_ns
+        with self._lock:
+            cached = self._cache.get(directory)
+        if cached is not None and cached[0] == mtime:
+            return cached[1], cached[2]
+
+        current_folders = []
+        current_files = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                if is_dir:
+                    current_folders.append(entry.name)
+                elif (self.file_filter is None) or entry.name.lower().endswith(self.file_filter):
+                    current_files.append(entry.name)
+        current_files = sorted(current_files, key=str.lower)
+        current_folders = sorted(current_folders, key=str.lower)
+
+        with self._lock:
+            self._cache[directory] = (mtime, current_folders, current_files)
+        return current_folders, current_files
+
+    def is_cached(self, directory):
+        """Check if directory listing is cached and up to date."""
+
+        with self._lock:
+            cached = self._cache.get(directory)
+        if cached is None:
+            return False
+        try:
+            return cached[0] == os.stat(directory).st_mtime_ns
+        except OSError:
+            return False
 
     def get_files(self):
 
-        current_files = [
-            x.name for x in self.cur_dir.glob("*") if not x.is_dir()]
-        current_folders = [
-            x.name for x in self.cur_dir.glob("*") if x.is_dir()]
-        current_files = sorted(current_files, key=str.lower)
-        current_folders = sorted(current_folders, key=str.lower)
+        try:
+            current_folders, current_files = self.list_directory(self.cur_dir)
+        except OSError:
+            return [self.error_label]
+        shown_files = current_files[0: self.num_pages * self.page_size]
+        if len(shown_files) < len(current_files):
+            shown_files = shown_files + [self.more_label]
 
-        return current_folders + current_files
+        return current_folders + shown_files
 
     def refresh(self, b=None):
 
-        # with self.out:
-        #    print('refresh')
-        # self.file_list.unobserve(self.move_folders, names='value')
+        if self.is_cached(self.cur_dir):
+            self._set_options()
+        else:
+            self._set_options([self.loading_label])
+            threading.Thread(
+                target=self._list_in_background, args=(self.cur_dir,), daemon=True
+            ).start()
+
+    def force_refresh(self, b=None):
+
+        with self._lock:
+            self._cache.pop(self.cur_dir, None)
+        self.refresh()
+
+    def _list_in_background(self, directory):
+
+        try:
+            self.list_directory(directory)
+        except OSError:
+            # get_files shows the error entry
+            pass
+        # only update if the user did not move to another folder meanwhile
+        if directory == self.cur_dir:
+            self._set_options()
+
+    def _set_options(self, files=None):
+
+        if files is None:
+            files = self.get_files()
         self.file_list.index = ()
         self.file_list.value = ()
-        self.file_list.options = [".."] + self.get_files()
-
-        # self.file_list.observe(self.move_folders, names='value')
+        self.file_list.options = [".."] + files
 
     def move_folders(self, change):
 
-        # with self.out:
-        #    print('move')
         if len(change["new"]) == 0:
             None
-            # self.cur_dir = self.cur_dir.resolve().parent
         else:
             if change["new"][0] == "..":
 
                 self.cur_dir = self.cur_dir.resolve().parent
+                self.num_pages = 1
+                self.refresh()
+            elif change["new"][0] == self.more_label:
+
+                self.num_pages += 1
                 self.refresh()
+            elif change["new"][0] in [self.loading_label, self.error_label]:
+
+                self.file_list.value = ()
             else:
 
                 old_dir = self.cur_dir
                 self.cur_dir = self.cur_dir.joinpath(change["new"][0])
                 if self.cur_dir.is_dir():
+                    self.num_pages = 1
                     self.refresh()
                 else:
                     self.cur_dir = old_dir
-
@@ -0,0 +1,167 @@
+"""
+Functions to write and read downsampled previews of processed images
+for fast review of segmentations.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import tifffile
+import skimage.io
+import skimage.transform
+import skimage.segmentation
+import dask
+import dask.array as da
+
+from . import dataloader
+
+MASK_BITS = {"nucl": 1, "cell": 2, "bact": 4}
+
+
+def _write_preview(filepath, image):
+    """Save (height, width, channels) image as multi-channel tif (CYX)."""
+
+    tifffile.imwrite(
+        filepath, np.moveaxis(image, 2, 0),
+        photometric="minisblack", metadata={"axes": "CYX"})
+
+
+def _read_preview(filepath):
+    """Read a tif saved by _write_preview as (height, width, channels)."""
+
+    image = tifffile.imread(filepath)
+    if image.ndim == 2:
+        image = image[np.newaxis]
+    return np.moveaxis(image, 0, 2)
+
+
+def write_previews(stack, masks, analysis_folder, stem, levels=3):
+    """
+    Save a downsampled pyramid of an image and the outlines of its masks.
+
+    Level k is downsampled by 2**k, computed from level k-1, and saved
+    as stem_preview_k.tif, a multi-channel (CYX) tif. Outlines are saved at full resolution
+    as stem_outlines.tif where each mask type sets one bit (see MASK_BITS).
+
+    Parameters
+    ----------
+    stack: 3d array
+        image of shape (height, width, channels) as returned by oirloader
+    masks: dict
+        labelled 2d masks with keys "nucl", "cell" and/or "bact"
+    analysis_folder: str or Path
+        folder where to save the previews
+    stem: str
+        name of the image without extension
+    levels: int
+        number of downsampled levels
+
+    """
+
+    analysis_folder = Path(analysis_folder)
+    preview = stack
+    for level in range(1, levels + 1):
+        preview = skimage.transform.downscale_local_mean(preview, (2, 2, 1))
+        save_to = analysis_folder.joinpath(stem + "_preview_" + str(level) + ".tif")
+        _write_preview(save_to, preview.astype(stack.dtype))
+
+    outlines = np.zeros(stack.shape[0:2], dtype=np.uint8)
+    for kind, mask in masks.items():
+        if mask is None:
+            continue
+        boundaries = skimage.segmentation.find_boundaries(mask, mode="inner")
+        outlines[boundaries] |= MASK_BITS[kind]
+    save_to = analysis_folder.joinpath(stem + "_outlines.tif")
+    skimage.io.imsave(save_to, outlines, check_contrast=False)
+
+
+def build_thumbnail_index(analysis_folder, level=3):
+    """
+    Collect the lowest resolution previews of an experiment in a single
+    Thumbnails.npz file in analysis_folder. Keys are the paths of the
+    images relative to analysis_folder without the preview suffix.
+
+    Parameters
+    ----------
+    analysis_folder: str or Path
+        folder containing previews (searched recursively)
+    level: int
+        pyramid level to use as thumbnail
+
+    Returns
+    -------
+    index_file: Path
+        path of the saved index
+
+    """
+
+    analysis_folder = Path(analysis_folder)
+    suffix = "_preview_" + str(level) + ".tif"
+    thumbnails = {}
+    for f in sorted(analysis_folder.rglob("*" + suffix)):
+        key = f.relative_to(analysis_folder).as_posix().replace(suffix, "")
+        thumbnails[key] = _read_preview(f)
+
+    index_file = analysis_folder.joinpath("Thumbnails.npz")
+    np.savez_compressed(index_file, **thumbnails)
+    return index_file
+
+
+def load_thumbnail_index(analysis_folder):
+    """Load the thumbnails saved by build_thumbnail_index as dict."""
+
+    with np.load(Path(analysis_folder).joinpath("Thumbnails.npz")) as index:
+        return {k: index[k] for k in index.files}
+
+
+def load_pyramid(filepath, analysis_folder, levels=3):
+    """
+    Multi-resolution version of an image, e.g. for napari with
+    multiscale=True and channel_axis=-1. The full resolution shape is
+    taken from the local outlines file, the oir file is only read when
+    the full resolution data are requested.
+
+    Parameters
+    ----------
+    filepath: str or Path
+        path to the oir file
+    analysis_folder: str or Path
+        folder containing the previews of the image
+    levels: int
+        number of downsampled levels
+
+    Returns
+    -------
+    pyramid: list of arrays
+        arrays of shape (height, width, channels), full resolution first
+
+    """
+
+    filepath = Path(filepath)
+    analysis_folder = Path(analysis_folder)
+    previews = [
+        _read_preview(analysis_folder.joinpath(
+            filepath.stem + "_preview_" + str(level) + ".tif"))
+        for level in range(1, levels + 1)]
+
+    n_channels = previews[0].shape[-1]
+    outlines_file = analysis_folder.joinpath(filepath.stem + "_outlines.tif")
+    if outlines_file.is_file():
+        # only the tif header is read
+        with tifffile.TiffFile(outlines_file) as tif:
+            shape = tif.pages[0].shape + (n_channels,)
+    else:
+        meta = dataloader.oirmetadata(filepath)
+        shape = (meta["height"], meta["width"], n_channels)
+    full = da.from_delayed(
+        dask.delayed(dataloader._load_stack)(filepath), shape=shape, dtype=previews[0].dtype)
+
+    return [full] + previews
+
+
+def load_outlines(filepath, analysis_folder, kind):
+    """Outlines of masks of kind "nucl", "cell" or "bact" as boolean array."""
+
+    outlines = skimage.io.imread(
+        Path(analysis_folder).joinpath(Path(filepath).stem + "_outlines.tif"))
+    return (outlines & MASK_BITS[kind]) > 0
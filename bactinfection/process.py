@@ -1,9 +1,12 @@
-from . import dataloader
+from . import dataloader, previews
 from . segmentation import segment_bacteria, segment_nucl_cellpose, segment_cell_cellpose
 import skimage.io
 import numpy as np
+import pandas as pd
 from pathlib import Path
 import os
+import time
+import warnings
 
 
 def single_image_analysis(
@@ -23,7 +26,9 @@ def single_image_analysis(
     masking="cell_no_nuclei",
     cell_precalc=False,
     diameter_cell=200,
-    background_estim='smo'
+    background_estim='smo',
+    write_preview=False,
+    preview_levels=3
 ):
 
     analysis_folder = Path(analysis_folder)
@@ -34,6 +39,8 @@ def single_image_analysis(
     report_file = filepath.joinpath(str(filepath).replace(".oir", "_error.txt"))
     #report_file = Path(str(filepath).replace('.ipynb', '.test'))
 
+    timings = {"filepath": filepath}
+    t0 = time.perf_counter()
     try:
         stack, channels = dataloader.oirloader(filepath)
     except:
@@ -47,10 +54,13 @@ def single_image_analysis(
                 f.write(nucl_channel + "channel not existing")
             return None
 
+    timings["loading"] = time.perf_counter() - t0
+
     model = None
 
     #try:
     # detect nuclei
+    t0 = time.perf_counter()
     im_nucl = stack[:, :, channels.index(nucl_channel)]
     nucl_mask = segment_nucl_cellpose(
         model, im_nucl, diameter_nucl,
@@ -62,8 +72,10 @@ def single_image_analysis(
         with open(report_file, "a+") as f:
             f.write("No nuclei found")
         return None
+    timings["nuclei"] = time.perf_counter() - t0
 
     if cell_channel is not None:
+        t0 = time.perf_counter()
         save_to = analysis_folder.joinpath(Path(filepath).stem + "_cell_seg.tif")
         if cell_precalc:
             cell_mask = skimage.io.imread(save_to)
@@ -76,8 +88,10 @@ def single_image_analysis(
             with open(report_file, "a+") as f:
                 f.write("No cell found")
             return None
+        timings["cells"] = time.perf_counter() - t0
 
     # detect bacteria
+    t0 = time.perf_counter()
     im_bact = stack[:, :, channels.index(bact_channel)]
 
     #im_bact = skimage.filters.median(im_bact, skimage.morphology.disk(2))
@@ -112,12 +126,116 @@ def single_image_analysis(
     bact_mask = skimage.morphology.label(bact_mask)
     save_to = analysis_folder.joinpath(Path(filepath).stem + "_bact_seg.tif")
     skimage.io.imsave(save_to, bact_mask.astype(np.uint16), check_contrast=False)
+    timings["bacteria"] = time.perf_counter() - t0
+
+    if write_preview:
+        masks = {"nucl": nucl_mask, "bact": bact_mask}
+        if cell_channel is not None:
+            masks["cell"] = cell_mask
+        previews.write_previews(
+            stack, masks, analysis_folder,
+            filepath.stem, levels=preview_levels)
+
+    return timings
 
     #except:
     #    with open(report_file, "a+") as f:
     #        f.write("Unknown error happened during segmentation")
     #        return None
 
+def preflight_check(client, file_list, param, save_report=True):
+    """
+    Validate a list of oir files using only their metadata before
+    scheduling the full analysis.
+
+    Parameters
+    ----------
+    client: dask client or None
+        client used to read metadata in parallel, sequential if None
+    file_list: list of str or Path
+        oir files to check
+    param: Param
+        processing parameters, channels are validated against
+        nucl_channel, bact_channel and cell_channel
+    save_report: bool
+        save the rejected files as Preflight_rejected.csv in
+        param.analysis_folder if the latter is set
+
+    Returns
+    -------
+    work_list: DataFrame
+        valid files with channels, height, width, dtype and estimated
+        cost (number of pixels)
+    rejected: DataFrame
+        rejected files with the reason of rejection: unreadable file,
+        missing channel, shape or dtype missing from the metadata or
+        unsupported dtype
+
+    """
+
+    if client is None:
+        all_meta = [dataloader.oirmetadata(f) for f in file_list]
+    else:
+        futures = client.map(dataloader.oirmetadata, file_list)
+        all_meta = client.gather(futures)
+
+    required = {
+        "nucl_channel": param.nucl_channel,
+        "bact_channel": param.bact_channel,
+        "cell_channel": param.cell_channel,
+    }
+
+    valid = []
+    rejected = []
+    no_shape = 0
+    for meta in all_meta:
+        if meta["error"] is not None:
+            rejected.append({"filepath": meta["filepath"], "reason": meta["error"]})
+            continue
+        missing = [
+            name + " " + str(c) for name, c in required.items()
+            if c is not None and c not in meta["channels"]]
+        if len(missing) > 0:
+            rejected.append({
+                "filepath": meta["filepath"],
+                "reason": "channel not existing: " + ", ".join(missing)})
+            continue
+
+        if None in [meta["height"], meta["width"], meta["dtype"]]:
+            no_shape += 1
+            rejected.append({
+                "filepath": meta["filepath"],
+                "reason": "shape or dtype not readable from metadata"})
+            continue
+        if meta["dtype"] not in dataloader.SUPPORTED_DTYPES:
+            rejected.append({
+                "filepath": meta["filepath"],
+                "reason": "unsupported dtype " + meta["dtype"]})
+            continue
+
+        meta["cost"] = meta["height"] * meta["width"] * len(meta["channels"])
+        del meta["error"]
+        valid.append(meta)
+
+    work_list = pd.DataFrame(
+        valid, columns=["filepath", "channels", "height", "width", "dtype",
+        "cost"])
+    rejected = pd.DataFrame(rejected, columns=["filepath", "reason"])
+
+    if (no_shape > 0) and (len(work_list) == 0):
+        warnings.warn(
+            "No file provides shape and dtype in its metadata, check the "
+            "metadata keys dataloader.META_HEIGHT, META_WIDTH, META_DTYPE "
+            "and META_BIT_DEPTH against oirpy.")
+
+    if save_report and (param.analysis_folder is not None):
+        analysis_folder = Path(param.analysis_folder)
+        if not analysis_folder.exists():
+            os.makedirs(analysis_folder)
+        rejected.to_csv(analysis_folder.joinpath("Preflight_rejected.csv"), index=False)
+
+    return work_list, rejected
+
 def multiple_images_dask(
     client,
     file_list,
@@ -136,11 +254,61 @@ def multiple_images_dask(
     masking="cell_no_nuclei",
     cell_precalc=False,
     diameter_cell=200,
-    background_estim='smo'):
+    background_estim='smo',
+    costs=None,
+    pixels=None,
+    memory_per_pixel=None,
+    write_preview=False,
+    preview_levels=3):
+    """
+    Run single_image_analysis on a list of files with a dask client.
+
+    If costs are given (e.g. est_cost from scheduling.order_longest_first),
+    tasks are submitted longest-first with a matching dask priority. With
+    pixels (e.g. the cost column of process.preflight_check) and
+    memory_per_pixel, each task additionally requests a "memory" resource
+    proportional to its pixel count, which requires workers started with
+    --resources "memory=...". Requests are capped to the largest memory
+    resource of the workers. With write_preview, a downsampled pyramid
+    with preview_levels levels and mask outlines are saved for each image
+    and the lowest level is collected in a Thumbnails.npz index in
+    analysis_folder (see previews module).
 
-    # Segment all images but don't do tracking (selection of label)
-    segmented = [
-        client.submit(
+    Returns
+    -------
+    segmented: list
+        per-stage timings (dict) of each file in the order of file_list,
+        None for files that failed
+    """
+
+    order = list(range(len(file_list)))
+    if costs is not None:
+        order = sorted(order, key=lambda k: costs[k], reverse=True)
+
+    if memory_per_pixel is not None:
+        if pixels is None:
+            raise ValueError("pixels are needed to request memory")
+        worker_memory = [
+            w.get("resources", {}).get("memory", 0)
+            for w in client.scheduler_info()["workers"].values()]
+        max_memory = max(worker_memory + [0])
+        if max_memory == 0:
+            raise ValueError('No worker provides a "memory" resource')
+
+    submitted = {}
+    for rank, k in enumerate(order):
+        options = {}
+        if costs is not None:
+            options["priority"] = len(order) - rank
+        if memory_per_pixel is not None:
+            memory = pixels[k] * memory_per_pixel
+            if memory > max_memory:
+                warnings.warn(
+                    str(file_list[k]) + " needs more memory than available on any worker, "
+                    "request capped to " + str(max_memory))
+                memory = max_memory
+            options["resources"] = {"memory": memory}
+        submitted[k] = client.submit(
             single_image_analysis,
             filepath=file_list[k],
             analysis_folder=analysis_folder,
@@ -156,12 +324,22 @@ def multiple_images_dask(
             nucl_model_type=nucl_model_type,
             resample=resample,
             masking=masking,
+            cell_precalc=cell_precalc,
+            diameter_cell=diameter_cell,
             background_estim=background_estim,
+            write_preview=write_preview,
+            preview_levels=preview_levels,
+            **options
             )
-        for k in range(len(file_list))
-    ]
-    for k in range(len(file_list)):
-        future = segmented[k]
+
+    segmented = [None] * len(file_list)
+    for k in order:
+        future = submitted.pop(k)
         segmented[k] = future.result()
         future.cancel()
-        del future
\ No newline at end of file
+        del future
+
+    if write_preview:
+        previews.build_thumbnail_index(analysis_folder, level=preview_levels)
+
+    return segmented
\ No newline at end of file
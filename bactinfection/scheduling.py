@@ -0,0 +1,155 @@
+"""
+Functions to estimate the cost of analysing images and to order
+batch tasks so that large images do not end up at the end of a run.
+"""
+
+import heapq
+import pandas as pd
+
+STAGES = ["loading", "nuclei", "cells", "bacteria"]
+
+
+def timings_to_frame(results):
+    """
+    Convert the output of process.multiple_images_dask to a DataFrame
+    usable as timings in estimate_costs. Failed files (None) are dropped.
+
+    Parameters
+    ----------
+    results: list of dict or None
+        per-stage timings as returned by process.multiple_images_dask
+
+    Returns
+    -------
+    timings: DataFrame
+        one row per file with a filepath column and one column per stage
+
+    """
+
+    timings = pd.DataFrame([r for r in results if r is not None])
+    if len(timings) == 0:
+        return pd.DataFrame(columns=["filepath"] + STAGES)
+    timings["filepath"] = timings["filepath"].astype(str)
+    return timings
+
+
+def estimate_costs(work_list, timings=None, group_by=None):
+    """
+    Estimate the cost of analysing each file of a work list.
+
+    Without timings the cost is the pixel count. With timings the cost
+    is in seconds: files that were already timed use their measured
+    duration, the others use per-stage durations per pixel fitted on
+    the timed files of the same group (e.g. same cell type or
+    diameter_cell) or, if their group has no timed file, of all files.
+
+    Parameters
+    ----------
+    work_list: DataFrame
+        output of process.preflight_check with a cost column (pixels)
+    timings: DataFrame, optional
+        historical per-stage timings, see timings_to_frame
+    group_by: str or list of str, optional
+        columns of work_list defining groups of files with similar
+        processing cost per pixel
+
+    Returns
+    -------
+    est_cost: list of float
+        estimated cost per file, in seconds if timings are given,
+        otherwise in pixels
+
+    """
+
+    costs = [float(c) for c in work_list["cost"]]
+    if timings is None or len(timings) == 0:
+        return costs
+
+    if group_by is None:
+        groups = [None] * len(work_list)
+    else:
+        groups = [tuple(g) for g in work_list[
+            [group_by] if isinstance(group_by, str) else group_by].values]
+
+    stages = [s for s in STAGES if s in timings.columns]
+    measured = {
+        str(f): row for f, row in zip(timings["filepath"], timings[stages].values)}
+
+    # accumulate per-stage durations and pixels per group and globally
+    sums = {}
+    for f, c, g in zip(work_list["filepath"], costs, groups):
+        if str(f) not in measured:
+            continue
+        for key in [g, "all"]:
+            seconds, pixels = sums.get(key, ([0.0] * len(stages), [0.0] * len(stages)))
+            for i, d in enumerate(measured[str(f)]):
+                if not pd.isnull(d):
+                    seconds[i] += d
+                    pixels[i] += c
+            sums[key] = (seconds, pixels)
+    if "all" not in sums:
+        return costs
+
+    def rate(key):
+        seconds, pixels = sums[key]
+        return sum([s / p for s, p in zip(seconds, pixels) if p > 0])
+
+    est_cost = []
+    for f, c, g in zip(work_list["filepath"], costs, groups):
+        if str(f) in measured:
+            est_cost.append(float(pd.Series(measured[str(f)]).fillna(0).sum()))
+        else:
+            est_cost.append(float(c * rate(g if g in sums else "all")))
+    return est_cost
+
+
+def order_longest_first(work_list, timings=None, group_by=None):
+    """
+    Sort a work list by decreasing estimated cost.
+
+    Parameters
+    ----------
+    work_list: DataFrame
+        output of process.preflight_check
+    timings: DataFrame, optional
+        historical per-stage timings, see estimate_costs
+    group_by: str or list of str, optional
+        columns of work_list defining groups, see estimate_costs
+
+    Returns
+    -------
+    ordered: DataFrame
+        copy of work_list with an est_cost column, largest first
+
+    """
+
+    ordered = work_list.copy()
+    ordered["est_cost"] = estimate_costs(work_list, timings, group_by)
+    ordered = ordered.sort_values("est_cost", ascending=False, kind="stable")
+    return ordered.reset_index(drop=True)
+
+
+def simulate_makespan(costs, n_workers):
+    """
+    Simulate greedy scheduling of tasks on workers: each task, taken
+    in the given order, goes to the first worker that becomes free.
+
+    Parameters
+    ----------
+    costs: list of float
+        task durations in submission order
+    n_workers: int
+        number of workers
+
+    Returns
+    -------
+    makespan: float
+        time at which the last task finishes
+
+    """
+
+    workers = [0.0] * n_workers
+    for c in costs:
+        start = heapq.heappop(workers)
+        heapq.heappush(workers, start + c)
+    return max(workers)
@@ -0,0 +1,80 @@
+"""
+Simulated benchmark of batch scheduling: compare the makespan of
+submitting files in directory order with the order given by
+scheduling.order_longest_first, with and without historical timings.
+
+The simulated experiment mimics folders acquired in sequence: most
+folders contain large frames of other cell types (diameter_cell 300),
+the last folders contain smaller macrophage frames (diameter_cell 140)
+that are denser and take more time per pixel. Each file's duration is
+rate(cell type) x pixels x noise. Timings of a previous run are
+simulated for a random fifth of the files.
+
+The bactinfection package must be importable, e.g. after
+pip install -e . or with PYTHONPATH set to the repository root:
+
+    python benchmarks/simulate_scheduling.py
+"""
+
+import random
+
+import pandas as pd
+
+from bactinfection.scheduling import order_longest_first, simulate_makespan
+
+SEED = 0
+N_WORKERS = 16
+# seconds per pixel
+RATES = {"other": 1e-6, "macro": 8e-6}
+
+
+def simulated_experiment(seed=SEED):
+    """Return a work list with true durations and simulated timings."""
+
+    rng = random.Random(seed)
+    rows = []
+    # 10 folders of 18 large frames, then 2 folders of 10 small frames
+    for folder in range(12):
+        cell = "other" if folder < 10 else "macro"
+        side = 1024 if cell == "other" else 512
+        for k in range(18 if cell == "other" else 10):
+            pixels = side * side * rng.choice([1, 2]) * 3
+            rows.append({
+                "filepath": "folder{}/image{}.oir".format(folder, k),
+                "cell": cell,
+                "cost": pixels,
+                "duration": RATES[cell] * pixels * rng.uniform(0.8, 1.2),
+            })
+    work_list = pd.DataFrame(rows)
+
+    timed = work_list.sample(frac=0.2, random_state=seed)
+    timings = pd.DataFrame({
+        "filepath": timed["filepath"],
+        "nuclei": 0.5 * timed["duration"],
+        "bacteria": 0.5 * timed["duration"],
+    })
+    return work_list, timings
+
+
+def makespan(ordered):
+    return simulate_makespan(list(ordered["duration"]), N_WORKERS)
+
+
+if __name__ == "__main__":
+
+    work_list, timings = simulated_experiment()
+    durations = list(work_list["duration"])
+    lower_bound = max(sum(durations) / N_WORKERS, max(durations))
+
+    results = {
+        "directory order": makespan(work_list),
+        "longest-first, pixels only": makespan(order_longest_first(work_list)),
+        "longest-first, timings": makespan(order_longest_first(work_list, timings)),
+        "longest-first, timings per cell": makespan(
+            order_longest_first(work_list, timings, group_by="cell")),
+    }
+
+    print("tasks: {}, workers: {}".format(len(work_list), N_WORKERS))
+    for name, value in results.items():
+        print("{:34s}{:.1f}".format(name + ":", value))
+    print("{:34s}{:.1f}".format("lower bound:", lower_bound))
@@ -0,0 +1,60 @@
+import pytest
+
+pytest.importorskip("oirpy")
+pytest.importorskip("cellpose")
+pytest.importorskip("smo")
+
+from bactinfection import dataloader, process
+from bactinfection.parameters import Param
+
+
+class FakeOirreader:
+    """Oirreader returning metadata depending on the file name."""
+
+    def __init__(self, filepath):
+        self.filepath = str(filepath)
+
+    def get_meta(self):
+        if "broken" in self.filepath:
+            raise IOError("cannot read")
+        meta = {"channel_names": ["DAPI", "Alexa Fluor 488"]}
+        if "noshape" not in self.filepath:
+            meta[dataloader.META_HEIGHT] = 100
+            meta[dataloader.META_WIDTH] = 200
+            meta[dataloader.META_DTYPE] = "uint16"
+        if "nobact" in self.filepath:
+            meta["channel_names"] = ["DAPI"]
+        return meta
+
+
+@pytest.fixture
+def oir_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(dataloader, "Oirreader", FakeOirreader)
+    names = ["good.oir", "broken.oir", "nobact.oir", "noshape.oir"]
+    for n in names:
+        tmp_path.joinpath(n).touch()
+    return [tmp_path.joinpath(n) for n in names]
+
+
+def test_oirmetadata(oir_files):
+
+    meta = dataloader.oirmetadata(oir_files[0])
+    assert meta["channels"] == ["DAPI", "Alexa Fluor 488"]
+    assert (meta["height"], meta["width"], meta["dtype"]) == (100, 200, "uint16")
+    assert meta["error"] is None
+
+    meta = dataloader.oirmetadata(oir_files[1])
+    assert meta["error"] is not None
+
+
+def test_preflight_check(oir_files, tmp_path):
+
+    param = Param(
+        data_folder=tmp_path, analysis_folder=tmp_path.joinpath("analysis"),
+        nucl_channel="DAPI", bact_channel="Alexa Fluor 488")
+    work_list, rejected = process.preflight_check(None, oir_files, param)
+
+    assert list(work_list["filepath"]) == [oir_files[0]]
+    assert work_list["cost"][0] == 100 * 200 * 2
+    assert list(rejected["filepath"]) == oir_files[1:]
+    assert tmp_path.joinpath("analysis", "Preflight_rejected.csv").is_file()